@@ -3,18 +3,16 @@ API Flask pour la détection de sténose carotidienne
 Expose les fonctionnalités du modèle U-Net via REST API
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 import cv2
 import numpy as np
-import tensorflow as tf
-from tensorflow.keras.models import load_model
-from tensorflow.keras.optimizers import Adam
 import os
 import base64
 from io import BytesIO
 from PIL import Image
 import configparser
+import response_codec
 
 app = Flask(__name__)
 CORS(app)  # Permet les requêtes depuis l'application C#
@@ -24,41 +22,78 @@ config = configparser.ConfigParser()
 config.read("config.ini")
 IMG_WIDTH = int(config["image"]["width"])
 IMG_HEIGHT = int(config["image"]["height"])
-CLASS_WEIGHT = float(config["model"]["class_weight"])
 THRESHOLD = float(config["model"]["threshold"])
 
-# Modèle global (chargé au démarrage)
+API_VERSION = "1.0.0"
+MODEL_PATH = "carotide_detector_v2.h5"
+
+# Modèle global (chargé au démarrage en mode processus unique)
 model = None
 
-# Fonctions personnalisées pour le modèle
-def weighted_binary_crossentropy(y_true, y_pred):
-    pos_weight = CLASS_WEIGHT
-    epsilon = tf.keras.backend.epsilon()
-    y_pred = tf.clip_by_value(y_pred, epsilon, 1.0 - epsilon)
-    bce = -(y_true * tf.math.log(y_pred) + (1.0 - y_true) * tf.math.log(1.0 - y_pred))
-    weighted_bce = bce * (y_true * pos_weight + (1.0 - y_true))
-    return tf.reduce_mean(weighted_bce)
+# Empreinte du modèle effectivement chargé, relevée une seule fois au chargement
+MODEL_ID = None
 
-def dice_coefficient(y_true, y_pred, smooth=1.0):
-    y_true_f = tf.cast(tf.keras.backend.flatten(y_true), tf.float32)
-    y_pred_f = tf.keras.backend.flatten(y_pred)
-    intersection = tf.keras.backend.sum(y_true_f * y_pred_f)
-    return (2. * intersection + smooth) / (tf.keras.backend.sum(y_true_f) + tf.keras.backend.sum(y_pred_f) + smooth)
+# Client vers les processus d'inférence (renseigné par serve.py)
+inference_client = None
 
-def load_unet_model(model_path="carotide_detector_v2.h5"):
-    """Charge le modèle U-Net au démarrage de l'API"""
-    try:
-        model = load_model(model_path, compile=False)
-        model.compile(
-            optimizer=Adam(learning_rate=0.0001),
-            loss=weighted_binary_crossentropy,
-            metrics=['accuracy', dice_coefficient]
-        )
-        print(f" Modèle {model_path} chargé avec succès")
-        return model
-    except Exception as e:
-        print(f" Erreur lors du chargement du modèle: {e}")
+def model_ready():
+    """Indique si une prédiction peut être servie"""
+    if inference_client is not None:
+        return inference_client.is_ready()
+    return model is not None
+
+def predict_masks(batch):
+    """Prédit les masques binaires d'un lot d'images (N, H, W, 1)
+
+    Délègue aux processus d'inférence lorsque l'API tourne derrière serve.py,
+    sinon utilise le modèle chargé dans ce processus.
+    """
+    if inference_client is not None:
+        return inference_client.predict(batch)
+    prediction = model.predict(batch, verbose=0)
+    return (prediction > THRESHOLD).astype(np.uint8)
+
+def model_version():
+    """Identifie le modèle chargé et la configuration qui influencent les résultats"""
+    return f"{API_VERSION}:{MODEL_ID}:{IMG_WIDTH}x{IMG_HEIGHT}:{THRESHOLD}"
+
+def negotiate_representation():
+    """Choisit le format (Accept) et la compression (Accept-Encoding) de la réponse"""
+    media_type = request.accept_mimetypes.best_match(response_codec.MEDIA_TYPES, default=response_codec.JSON)
+    encoding = request.accept_encodings.best_match(response_codec.ENCODINGS, default=response_codec.IDENTITY)
+    return media_type, encoding
+
+def result_etag(*parts):
+    """ETag d'un résultat: entrées de la requête, version du modèle et représentation"""
+    return response_codec.make_etag(model_version(), *negotiate_representation(), *parts)
+
+def not_modified(etag):
+    """Réponse 304 si le client possède déjà ce résultat, sinon None
+
+    Comparaison faible (RFC 9110), pour rester valide derrière un proxy qui
+    transforme l'ETag en W/"..." ; If-None-Match: * est ignoré car un POST
+    ne désigne pas de ressource existante que le client aurait en cache.
+    """
+    if_none_match = request.if_none_match
+    if if_none_match.star_tag or not if_none_match.contains_weak(etag):
         return None
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.vary.update(("Accept", "Accept-Encoding"))
+    return response
+
+def send_result(payload, etag):
+    """Sérialise, compresse et étiquette un résultat de prédiction"""
+    media_type, encoding = negotiate_representation()
+    body = response_codec.encode_body(payload, media_type)
+    body, encoding = response_codec.compress_body(body, encoding)
+    
+    response = Response(body, mimetype=media_type)
+    if encoding != response_codec.IDENTITY:
+        response.headers["Content-Encoding"] = encoding
+    response.set_etag(etag)
+    response.vary.update(("Accept", "Accept-Encoding"))
+    return response
 
 def preprocess_image(image_array):
     """Prétraite une image pour la prédiction"""
@@ -106,6 +141,33 @@ def extract_carotid_areas(mask):
     else:
         return 0, 0
 
+def predict_study(images):
+    """
+    Prédit et analyse une série d'images (liste non vide) en un seul lot
+
+    Retourne les aires gauche/droite de chaque image et les masques en PNG
+    (encodés en base64 uniquement pour la réponse JSON)
+    """
+    batch = np.stack([preprocess_image(img_array) for img_array in images])
+    batch = batch.reshape(len(images), IMG_HEIGHT, IMG_WIDTH, 1).astype(np.float32)
+    binary_preds = predict_masks(batch)
+    
+    areas_left = []
+    areas_right = []
+    masks_png = []
+    for binary_pred in binary_preds:
+        # Extraire les aires
+        area_left, area_right = extract_carotid_areas(binary_pred)
+        areas_left.append(area_left)
+        areas_right.append(area_right)
+        
+        # Encoder le masque en PNG
+        mask_img = (binary_pred.reshape(IMG_HEIGHT, IMG_WIDTH) * 255).astype(np.uint8)
+        _, buffer = cv2.imencode('.png', mask_img)
+        masks_png.append(buffer.tobytes())
+    
+    return areas_left, areas_right, masks_png
+
 def calculate_stenosis(areas_left, areas_right):
     """Calcule le pourcentage de sténose pour chaque carotide"""
     if len(areas_left) == 0 or len(areas_right) == 0:
@@ -129,8 +191,8 @@ def health_check():
     """Vérifie que l'API est fonctionnelle"""
     return jsonify({
         "status": "healthy",
-        "model_loaded": model is not None,
-        "version": "1.0.0"
+        "model_loaded": model_ready(),
+        "version": API_VERSION
     })
 
 @app.route('/api/detect-stenosis', methods=['POST'])
@@ -149,10 +211,10 @@ def detect_stenosis():
     - processed_images: nombre d'images traitées
     """
     try:
-        if model is None:
+        if not model_ready():
             return jsonify({"error": "Modèle non chargé"}), 500
         
-        images = []
+        images_bytes = []
         
         # Cas 1: Images encodées en base64 dans le JSON
         if request.is_json:
@@ -161,64 +223,48 @@ def detect_stenosis():
             
             for img_b64 in image_data_list:
                 # Décoder base64
-                img_bytes = base64.b64decode(img_b64)
-                img = Image.open(BytesIO(img_bytes))
-                img_array = np.array(img)
-                images.append(img_array)
+                images_bytes.append(base64.b64decode(img_b64))
         
         # Cas 2: Upload de fichiers
         elif 'files' in request.files:
             files = request.files.getlist('files')
             for file in files:
-                img = Image.open(file.stream)
-                img_array = np.array(img)
-                images.append(img_array)
+                images_bytes.append(file.read())
         
         else:
             return jsonify({"error": "Aucune image fournie"}), 400
         
+        # Mêmes images et même modèle => même résultat (indépendant de
+        # l'enveloppe JSON ou multipart de la requête)
+        etag = result_etag(request.path, *images_bytes)
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+        
+        images = []
+        for img_bytes in images_bytes:
+            img = Image.open(BytesIO(img_bytes))
+            img_array = np.array(img)
+            images.append(img_array)
+        
         if len(images) == 0:
             return jsonify({"error": "Aucune image valide trouvée"}), 400
         
-        # Traiter chaque image
-        areas_left = []
-        areas_right = []
-        masks_b64 = []
-        
-        for img_array in images:
-            # Prétraitement
-            processed_img = preprocess_image(img_array)
-            input_img = processed_img.reshape(1, IMG_HEIGHT, IMG_WIDTH, 1)
-            
-            # Prédiction
-            prediction = model.predict(input_img, verbose=0)[0]
-            
-            # Binariser
-            binary_pred = (prediction > THRESHOLD).astype(np.uint8)
-            
-            # Extraire les aires
-            area_left, area_right = extract_carotid_areas(binary_pred)
-            areas_left.append(area_left)
-            areas_right.append(area_right)
-            
-            # Encoder le masque en base64 pour le retour (optionnel)
-            mask_img = (binary_pred.reshape(IMG_HEIGHT, IMG_WIDTH) * 255).astype(np.uint8)
-            _, buffer = cv2.imencode('.png', mask_img)
-            mask_b64 = base64.b64encode(buffer).decode('utf-8')
-            masks_b64.append(mask_b64)
+        # Traiter toutes les images en un seul lot
+        areas_left, areas_right, masks_png = predict_study(images)
         
         # Calculer le pourcentage de sténose
         stenosis_left, stenosis_right = calculate_stenosis(areas_left, areas_right)
         
-        return jsonify({
+        return send_result({
             "success": True,
-            "stenosis_left_percent": round(stenosis_left, 2),
-            "stenosis_right_percent": round(stenosis_right, 2),
+            "stenosis_left_percent": round(float(stenosis_left), 2),
+            "stenosis_right_percent": round(float(stenosis_right), 2),
             "processed_images": len(images),
             "areas_left": areas_left,
             "areas_right": areas_right,
-            "masks": masks_b64  # Masques encodés en base64
-        })
+            "masks": masks_png  # Masques PNG (base64 en JSON)
+        }, etag)
     
     except Exception as e:
         return jsonify({
@@ -232,30 +278,34 @@ def process_single_image():
     Traite une seule image et retourne le masque de segmentation
     """
     try:
-        if model is None:
+        if not model_ready():
             return jsonify({"error": "Modèle non chargé"}), 500
         
         # Recevoir l'image
         if 'file' in request.files:
             file = request.files['file']
-            img = Image.open(file.stream)
-            img_array = np.array(img)
+            img_bytes = file.read()
         elif request.is_json:
             data = request.get_json()
             img_b64 = data.get('image')
             img_bytes = base64.b64decode(img_b64)
-            img = Image.open(BytesIO(img_bytes))
-            img_array = np.array(img)
         else:
             return jsonify({"error": "Aucune image fournie"}), 400
         
+        etag = result_etag(request.path, img_bytes)
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+        
+        img = Image.open(BytesIO(img_bytes))
+        img_array = np.array(img)
+        
         # Traitement
         processed_img = preprocess_image(img_array)
-        input_img = processed_img.reshape(1, IMG_HEIGHT, IMG_WIDTH, 1)
+        input_img = processed_img.reshape(1, IMG_HEIGHT, IMG_WIDTH, 1).astype(np.float32)
         
         # Prédiction
-        prediction = model.predict(input_img, verbose=0)[0]
-        binary_pred = (prediction > THRESHOLD).astype(np.uint8)
+        binary_pred = predict_masks(input_img)[0]
         
         # Extraire les aires
         area_left, area_right = extract_carotid_areas(binary_pred)
@@ -263,14 +313,13 @@ def process_single_image():
         # Encoder le masque
         mask_img = (binary_pred.reshape(IMG_HEIGHT, IMG_WIDTH) * 255).astype(np.uint8)
         _, buffer = cv2.imencode('.png', mask_img)
-        mask_b64 = base64.b64encode(buffer).decode('utf-8')
         
-        return jsonify({
+        return send_result({
             "success": True,
-            "mask": mask_b64,
+            "mask": buffer.tobytes(),
             "area_left": float(area_left),
             "area_right": float(area_right)
-        })
+        }, etag)
     
     except Exception as e:
         return jsonify({
@@ -294,7 +343,7 @@ def detect_stenosis_from_center():
     - processed_images: nombre d'images traitées
     """
     try:
-        if model is None:
+        if not model_ready():
             return jsonify({"error": "Modèle non chargé"}), 500
         
         # Recevoir les paramètres
@@ -329,6 +378,17 @@ def detect_stenosis_from_center():
         # Sélectionner les slices
         selected_files = dicom_files[start_slice:end_slice + 1]
         
+        # Les fichiers sont identifiés par nom, taille et date de modification
+        # pour éviter de relire les DICOM avant de répondre 304
+        file_ids = []
+        for dcm_file in selected_files:
+            stat = dcm_file.stat()
+            file_ids.append(f"{dcm_file.name}:{stat.st_size}:{stat.st_mtime_ns}")
+        etag = result_etag(request.path, dicom_path.resolve(), center_slice, *file_ids)
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+        
         images = []
         for dcm_file in selected_files:
             # Lire le DICOM
@@ -341,48 +401,27 @@ def detect_stenosis_from_center():
             
             images.append(img_normalized)
         
-        # Traiter chaque image
-        areas_left = []
-        areas_right = []
-        masks_b64 = []
-        
-        for img_array in images:
-            # Prétraitement
-            processed_img = preprocess_image(img_array)
-            input_img = processed_img.reshape(1, IMG_HEIGHT, IMG_WIDTH, 1)
-            
-            # Prédiction
-            prediction = model.predict(input_img, verbose=0)[0]
-            
-            # Binariser
-            binary_pred = (prediction > THRESHOLD).astype(np.uint8)
-            
-            # Extraire les aires
-            area_left, area_right = extract_carotid_areas(binary_pred)
-            areas_left.append(area_left)
-            areas_right.append(area_right)
-            
-            # Encoder le masque (optionnel)
-            mask_img = (binary_pred.reshape(IMG_HEIGHT, IMG_WIDTH) * 255).astype(np.uint8)
-            _, buffer = cv2.imencode('.png', mask_img)
-            mask_b64 = base64.b64encode(buffer).decode('utf-8')
-            masks_b64.append(mask_b64)
+        # Traiter toutes les images en un seul lot (aucune si le centre
+        # est au-delà de la dernière slice)
+        areas_left, areas_right, masks_png = [], [], []
+        if len(images) > 0:
+            areas_left, areas_right, masks_png = predict_study(images)
         
         # Calculer le pourcentage de sténose
         stenosis_left, stenosis_right = calculate_stenosis(areas_left, areas_right)
         
-        return jsonify({
+        return send_result({
             "success": True,
-            "stenosis_left_percent": round(stenosis_left, 2),
-            "stenosis_right_percent": round(stenosis_right, 2),
+            "stenosis_left_percent": round(float(stenosis_left), 2),
+            "stenosis_right_percent": round(float(stenosis_right), 2),
             "processed_images": len(images),
             "center_slice": center_slice,
             "start_slice": start_slice,
             "end_slice": end_slice,
             "areas_left": areas_left,
             "areas_right": areas_right,
-            "masks": masks_b64
-        })
+            "masks": masks_png
+        }, etag)
     
     except Exception as e:
         return jsonify({
@@ -392,8 +431,11 @@ def detect_stenosis_from_center():
 
 
 if __name__ == '__main__':
+    from unet_model import load_unet_model
+    
     print(" Démarrage de l'API de détection de sténose...")
-    model = load_unet_model()
+    MODEL_ID = response_codec.file_identity(MODEL_PATH)
+    model = load_unet_model(MODEL_PATH)
     
     if model is None:
         print("  ATTENTION: L'API démarre mais le modèle n'est pas chargé!")
@@ -0,0 +1,389 @@
+"""
+Processus d'inférence dédiés, répartiteur et client pour les front-ends
+Les lots d'images et les masques transitent par mémoire partagée,
+seuls de petits messages de contrôle passent entre processus
+"""
+
+import itertools
+import os
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Période de surveillance des processus d'inférence (secondes)
+WATCH_INTERVAL = 1.0
+
+# Délai avant de relancer un processus tombé, doublé tant qu'il meurt
+# avant d'avoir chargé le modèle
+RESTART_DELAY = 1.0
+MAX_RESTART_DELAY = 60.0
+
+
+def parse_cpu_list(spec):
+    """Convertit une liste de CPU type "0-3,6" en ensemble d'indices"""
+    cpus = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-", 1)
+            cpus.update(range(int(first), int(last) + 1))
+        else:
+            cpus.add(int(part))
+    return cpus
+
+def start_pinned(process, cpus):
+    """
+    Démarre process épinglé sur les CPU donnés (aucun épinglage si vide)
+
+    Sous Linux l'affinité est posée sur le thread appelant juste avant le
+    lancement puis restaurée: l'enfant en hérite dès sa création, avant tout
+    import et donc avant que numpy ne démarre ses threads. Sous Windows,
+    psutil applique l'affinité au processus entier, threads existants compris.
+    """
+    if not cpus:
+        process.start()
+        return
+    if hasattr(os, "sched_setaffinity"):
+        previous = os.sched_getaffinity(0)
+        os.sched_setaffinity(0, cpus)
+        try:
+            process.start()
+        finally:
+            os.sched_setaffinity(0, previous)
+        return
+
+    process.start()
+    try:
+        import psutil
+    except ImportError:
+        print(" psutil non installé: affinité CPU ignorée (pip install psutil)")
+        return
+    psutil.Process(process.pid).cpu_affinity(sorted(cpus))
+
+def run_inference_worker(worker_id, connection, settings):
+    """
+    Boucle principale d'un processus d'inférence
+
+    Possède le modèle et reçoit sur connection, une extrémité de Pipe qui lui
+    est propre, des requêtes (job_id, frontend_id, nom du segment, forme du
+    lot, échéance). Les masques binaires sont écrits dans le même segment,
+    juste après le lot d'entrée, puis ("done", frontend_id, job_id, erreur)
+    est renvoyé. ("loaded",) signale que le modèle est prêt; None arrête.
+    """
+    # TensorFlow n'est importé qu'ici, jamais dans les front-ends
+    from unet_model import configure_threads, load_unet_model
+    from response_codec import file_identity
+
+    # Un modèle remplacé depuis le démarrage de serve.py ne doit pas être
+    # servi sous l'ETag de l'ancien
+    if file_identity(settings["model_path"]) != settings["model_id"]:
+        print(f" Processus d'inférence {worker_id}: {settings['model_path']} a changé, redémarrer serve.py")
+        return
+
+    configure_threads(settings["intra_op_threads"], settings["inter_op_threads"])
+    model = load_unet_model(settings["model_path"])
+    if model is None:
+        print(f" Processus d'inférence {worker_id}: modèle non chargé, arrêt")
+        return
+
+    threshold = settings["threshold"]
+    connection.send(("loaded",))
+    print(f" Processus d'inférence {worker_id} prêt (pid {os.getpid()})")
+
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+
+        job_id, frontend_id, shm_name, shape, deadline = message
+        if time.time() > deadline:
+            # Le front-end a déjà abandonné ce lot
+            connection.send(("done", frontend_id, job_id, "Délai dépassé"))
+            continue
+
+        error = None
+        try:
+            shm = shared_memory.SharedMemory(name=shm_name)
+            try:
+                batch = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+                masks = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=batch.nbytes)
+                prediction = model.predict(batch, verbose=0)
+                masks[:] = (prediction > threshold).reshape(shape)
+                del batch, masks
+            finally:
+                shm.close()
+        except Exception as e:
+            error = str(e)
+
+        connection.send(("done", frontend_id, job_id, error))
+
+
+class WorkerPool:
+    """
+    Côté serve.py: possède les processus d'inférence et leur route les lots
+
+    Chaque processus a son propre Pipe, recréé à chaque redémarrage: un
+    processus tué ne peut pas laisser de verrou partagé bloquer les autres.
+    Les front-ends déposent leurs lots dans leur propre file
+    (request_queues[frontend_id]); le pool les confie au processus prêt le
+    moins chargé et renvoie les réponses dans response_queues[frontend_id].
+    ready_event n'est positionné que tant qu'au moins un processus est prêt.
+    """
+
+    def __init__(self, ctx, worker_count, request_queues, response_queues, ready_event, settings,
+                 watch_interval=WATCH_INTERVAL):
+        self.ctx = ctx
+        self.request_queues = request_queues
+        self.response_queues = response_queues
+        self.ready_event = ready_event
+        self.settings = settings
+        self.watch_interval = watch_interval
+        self._lock = threading.Lock()
+        self._stopping = False
+        self._workers = [
+            {
+                "process": None,
+                "connection": None,
+                "send_lock": threading.Lock(),
+                "loaded": False,
+                "jobs": set(),
+                "restart_at": None,
+                "restart_delay": RESTART_DELAY,
+            }
+            for _ in range(worker_count)
+        ]
+
+    def start(self):
+        for worker_id in range(len(self._workers)):
+            self._start_worker(worker_id)
+        for frontend_id in range(len(self.request_queues)):
+            threading.Thread(target=self._forward, args=(frontend_id,), daemon=True).start()
+        threading.Thread(target=self._watch, daemon=True).start()
+
+    def stop(self):
+        self._stopping = True
+        for request_queue in self.request_queues:
+            request_queue.put(None)
+        for slot in self._workers:
+            if slot["connection"] is not None:
+                try:
+                    with slot["send_lock"]:
+                        slot["connection"].send(None)
+                except OSError:
+                    pass
+        for slot in self._workers:
+            process = slot["process"]
+            if process is not None:
+                process.join(timeout=10)
+                if process.is_alive():
+                    process.terminate()
+
+    def loaded_workers(self):
+        """Nombre de processus d'inférence prêts"""
+        with self._lock:
+            return sum(1 for slot in self._workers if slot["loaded"])
+
+    def worker_pids(self):
+        """PID des processus d'inférence vivants, par worker_id (None sinon)"""
+        return [slot["process"].pid if slot["process"] is not None else None for slot in self._workers]
+
+    def _start_worker(self, worker_id):
+        """Démarre (ou redémarre) le processus worker_id sur un Pipe neuf"""
+        cpu_specs = self.settings["inference_cpus"]
+        connection, child_connection = self.ctx.Pipe()
+        process = self.ctx.Process(
+            target=run_inference_worker,
+            args=(worker_id, child_connection, self.settings),
+            name=f"inference-{worker_id}"
+        )
+        start_pinned(process, cpu_specs[worker_id % len(cpu_specs)])
+        child_connection.close()
+
+        with self._lock:
+            slot = self._workers[worker_id]
+            slot.update(process=process, connection=connection, loaded=False, jobs=set(), restart_at=None)
+        threading.Thread(target=self._receive, args=(worker_id, connection), daemon=True).start()
+
+    def _receive(self, worker_id, connection):
+        """Lit les messages d'un processus jusqu'à la fermeture de son Pipe"""
+        slot = self._workers[worker_id]
+        while True:
+            try:
+                message = connection.recv()
+            except (EOFError, OSError):
+                return
+
+            if message[0] == "loaded":
+                with self._lock:
+                    if slot["connection"] is connection:
+                        slot["loaded"] = True
+                        slot["restart_delay"] = RESTART_DELAY
+                self._update_ready()
+                continue
+
+            _, frontend_id, job_id, error = message
+            with self._lock:
+                slot["jobs"].discard((frontend_id, job_id))
+            self.response_queues[frontend_id].put((job_id, error))
+
+    def _forward(self, frontend_id):
+        """Transmet les lots d'un front-end au processus prêt le moins chargé"""
+        request_queue = self.request_queues[frontend_id]
+        while True:
+            message = request_queue.get()
+            if message is None:
+                return
+
+            job_id = message[0]
+            with self._lock:
+                ready = [slot for slot in self._workers if slot["loaded"]]
+                if not ready:
+                    slot = None
+                else:
+                    slot = min(ready, key=lambda s: len(s["jobs"]))
+                    slot["jobs"].add((frontend_id, job_id))
+                    connection = slot["connection"]
+
+            if slot is None:
+                self.response_queues[frontend_id].put((job_id, "Aucun processus d'inférence disponible"))
+                continue
+            try:
+                with slot["send_lock"]:
+                    connection.send(message)
+            except OSError:
+                # Processus mort entre-temps: _watch le relancera
+                with self._lock:
+                    slot["jobs"].discard((frontend_id, job_id))
+                self.response_queues[frontend_id].put((job_id, "Processus d'inférence arrêté"))
+
+    def _watch(self):
+        while not self._stopping:
+            self._check_workers()
+            time.sleep(self.watch_interval)
+
+    def _check_workers(self):
+        """Relance les processus tombés, avec un délai croissant s'ils meurent avant d'être prêts"""
+        now = time.monotonic()
+        for worker_id, slot in enumerate(self._workers):
+            process = slot["process"]
+            if process is None:
+                if slot["restart_at"] is not None and now >= slot["restart_at"] and not self._stopping:
+                    self._start_worker(worker_id)
+                continue
+            if process.is_alive() or self._stopping:
+                continue
+
+            with self._lock:
+                lost_jobs = slot["jobs"]
+                was_loaded = slot["loaded"]
+                connection = slot["connection"]
+                slot.update(process=None, connection=None, loaded=False, jobs=set())
+            with slot["send_lock"]:
+                connection.close()
+            self._update_ready()
+
+            # Débloquer les front-ends qui attendaient ces lots
+            for frontend_id, job_id in lost_jobs:
+                self.response_queues[frontend_id].put((job_id, "Processus d'inférence arrêté"))
+
+            # Code de sortie 0: modèle absent ou modifié, inutile de relancer
+            if process.exitcode == 0:
+                print(f" Processus d'inférence {worker_id} arrêté, pas de redémarrage")
+                continue
+
+            if was_loaded:
+                slot["restart_delay"] = RESTART_DELAY
+            delay = slot["restart_delay"]
+            slot["restart_delay"] = min(delay * 2, MAX_RESTART_DELAY)
+            slot["restart_at"] = now + delay
+            print(f" Processus d'inférence {worker_id} arrêté (code {process.exitcode}), "
+                  f"redémarrage dans {delay:.0f} s")
+
+    def _update_ready(self):
+        if self.loaded_workers() > 0:
+            self.ready_event.set()
+        else:
+            self.ready_event.clear()
+
+
+class InferenceClient:
+    """
+    Côté front-end: envoie des lots aux processus d'inférence
+
+    Les lots partent dans la file propre au front-end, lue par WorkerPool.
+    Un thread de distribution lit la file de réponses du front-end et réveille
+    le thread de requête Flask correspondant.
+    """
+
+    def __init__(self, frontend_id, request_queue, response_queue, ready_event, timeout=300):
+        self.frontend_id = frontend_id
+        self.request_queue = request_queue
+        self.response_queue = response_queue
+        self.ready_event = ready_event
+        self.timeout = timeout
+        self._job_ids = itertools.count()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+
+    def is_ready(self):
+        return self.ready_event.is_set()
+
+    def _dispatch(self):
+        while True:
+            try:
+                job_id, error = self.response_queue.get()
+            except (EOFError, OSError):
+                return
+            with self._lock:
+                pending = self._pending.get(job_id)
+            if pending is not None:
+                pending["error"] = error
+                pending["done"].set()
+
+    def predict(self, batch):
+        """Prédit les masques binaires (uint8) d'un lot float32 (N, H, W, 1)"""
+        if not self.is_ready():
+            raise RuntimeError("Aucun processus d'inférence disponible")
+
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        shm = shared_memory.SharedMemory(create=True, size=batch.nbytes + batch.size)
+        try:
+            shared_batch = np.ndarray(batch.shape, dtype=np.float32, buffer=shm.buf)
+            shared_batch[:] = batch
+            del shared_batch
+
+            job_id = next(self._job_ids)
+            pending = {"done": threading.Event(), "error": None}
+            with self._lock:
+                self._pending[job_id] = pending
+            try:
+                deadline = time.time() + self.timeout
+                self.request_queue.put((job_id, self.frontend_id, shm.name, batch.shape, deadline))
+                while not pending["done"].wait(1.0):
+                    if not self.is_ready():
+                        raise RuntimeError("Aucun processus d'inférence disponible")
+                    if time.time() > deadline:
+                        raise TimeoutError("Pas de réponse du processus d'inférence")
+            finally:
+                with self._lock:
+                    del self._pending[job_id]
+
+            if pending["error"] is not None:
+                raise RuntimeError(pending["error"])
+
+            shared_masks = np.ndarray(batch.shape, dtype=np.uint8, buffer=shm.buf, offset=batch.nbytes)
+            masks = shared_masks.copy()
+            del shared_masks
+            return masks
+        finally:
+            shm.close()
+            shm.unlink()
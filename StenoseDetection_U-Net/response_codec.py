@@ -0,0 +1,111 @@
+"""
+Sérialisation et compression des réponses de l'API
+JSON compact (orjson si installé), MessagePack / CBOR optionnels selon Accept,
+compression gzip / zstd selon Accept-Encoding, ETags dérivés des entrées
+"""
+
+import base64
+import gzip
+import hashlib
+import json
+
+import numpy as np
+
+# Dépendances optionnelles: les formats correspondants ne sont proposés
+# que si le module est installé
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+CBOR = "application/cbor"
+
+# Ordre de préférence du serveur, JSON en premier pour Accept: */*
+MEDIA_TYPES = [JSON]
+if msgpack is not None:
+    MEDIA_TYPES += [MSGPACK, "application/x-msgpack"]
+if cbor2 is not None:
+    MEDIA_TYPES.append(CBOR)
+
+IDENTITY = "identity"
+ENCODINGS = ["gzip"]
+if zstandard is not None:
+    ENCODINGS.insert(0, "zstd")
+
+# En dessous de cette taille la compression coûte plus qu'elle ne rapporte
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = 5
+ZSTD_LEVEL = 3
+
+
+def file_identity(path):
+    """Empreinte du contenu d'un fichier (modèle), None s'il est absent"""
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+def make_etag(*parts):
+    """ETag fort: empreinte SHA-256 des éléments qui déterminent la réponse"""
+    digest = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, bytes):
+            part = str(part).encode("utf-8")
+        digest.update(len(part).to_bytes(8, "little"))
+        digest.update(part)
+    return digest.hexdigest()[:32]
+
+def _json_default(obj):
+    """Types non gérés par JSON: masques PNG en base64, scalaires numpy"""
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return base64.b64encode(obj).decode("ascii")
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Type non sérialisable: {type(obj).__name__}")
+
+def _binary_default(obj):
+    """Types non gérés par MessagePack / CBOR (les bytes restent binaires)"""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Type non sérialisable: {type(obj).__name__}")
+
+def encode_body(payload, media_type):
+    """Sérialise la réponse; les masques restent en bytes bruts hors JSON"""
+    if media_type in (MSGPACK, "application/x-msgpack"):
+        return msgpack.packb(payload, default=_binary_default)
+    if media_type == CBOR:
+        return cbor2.dumps(payload, default=lambda encoder, obj: encoder.encode(_binary_default(obj)))
+    if orjson is not None:
+        return orjson.dumps(payload, default=_json_default)
+    return json.dumps(payload, default=_json_default, separators=(",", ":")).encode("utf-8")
+
+def compress_body(body, encoding):
+    """Compresse le corps; retourne (corps, encodage effectivement appliqué)"""
+    if encoding == IDENTITY or len(body) < MIN_COMPRESS_SIZE:
+        return body, IDENTITY
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body), encoding
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0), encoding
+    return body, IDENTITY
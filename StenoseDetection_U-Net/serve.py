@@ -0,0 +1,99 @@
+"""
+Lanceur multi-processus de l'API de détection de sténose
+Plusieurs front-ends Flask (HTTP, décodage, encodage PNG) partagent le même
+port et délèguent la prédiction à un ou plusieurs processus d'inférence
+Configuration: section [serving] de config.ini
+"""
+
+import configparser
+import multiprocessing as mp
+import socket
+
+from inference_worker import InferenceClient, WorkerPool, parse_cpu_list, start_pinned
+from response_codec import file_identity
+
+
+def load_serving_settings(path="config.ini"):
+    """Lit la section [serving] de config.ini avec des valeurs par défaut"""
+    config = configparser.ConfigParser()
+    config.read(path)
+    serving = config["serving"] if config.has_section("serving") else {}
+    return {
+        "host": serving.get("host", "0.0.0.0"),
+        "port": int(serving.get("port", 5000)),
+        "frontend_processes": int(serving.get("frontend_processes", 2)),
+        "inference_processes": int(serving.get("inference_processes", 1)),
+        "intra_op_threads": int(serving.get("intra_op_threads", 0)),
+        "inter_op_threads": int(serving.get("inter_op_threads", 0)),
+        "frontend_cpus": parse_cpu_list(serving.get("frontend_cpus", "")),
+        "inference_cpus": [parse_cpu_list(spec) for spec in serving.get("inference_cpus", "").split(";")],
+        "request_timeout": float(serving.get("request_timeout", 300)),
+        "model_path": serving.get("model_path", "carotide_detector_v2.h5"),
+        "threshold": float(config["model"]["threshold"]),
+    }
+
+def run_frontend(frontend_id, listen_socket, request_queue, response_queue, ready_event, settings):
+    """Processus front-end: sert l'application Flask sur le socket partagé"""
+    from werkzeug.serving import make_server
+    import flask_api
+
+    flask_api.MODEL_PATH = settings["model_path"]
+    flask_api.MODEL_ID = settings["model_id"]
+    flask_api.inference_client = InferenceClient(
+        frontend_id, request_queue, response_queue, ready_event,
+        timeout=settings["request_timeout"]
+    )
+
+    server = make_server(
+        settings["host"], settings["port"], flask_api.app,
+        threaded=True, fd=listen_socket.fileno()
+    )
+    server.serve_forever()
+
+def main():
+    settings = load_serving_settings()
+    ctx = mp.get_context("spawn")
+
+    # Empreinte du modèle relevée une fois: elle entre dans les ETags des
+    # front-ends et chaque processus d'inférence vérifie qu'il charge ce fichier
+    settings["model_id"] = file_identity(settings["model_path"])
+
+    # Socket d'écoute créé ici puis transmis à chaque front-end
+    listen_socket = socket.create_server((settings["host"], settings["port"]), backlog=128)
+
+    # Une file de lots et une file de réponses par front-end, chacune n'ayant
+    # qu'un lecteur: le pool d'un côté, le front-end de l'autre
+    request_queues = [ctx.Queue() for _ in range(settings["frontend_processes"])]
+    response_queues = [ctx.Queue() for _ in range(settings["frontend_processes"])]
+    ready_event = ctx.Event()
+
+    pool = WorkerPool(ctx, settings["inference_processes"], request_queues, response_queues, ready_event, settings)
+    pool.start()
+
+    frontends = []
+    for frontend_id in range(settings["frontend_processes"]):
+        frontend = ctx.Process(
+            target=run_frontend,
+            args=(frontend_id, listen_socket, request_queues[frontend_id],
+                  response_queues[frontend_id], ready_event, settings),
+            name=f"frontend-{frontend_id}"
+        )
+        start_pinned(frontend, settings["frontend_cpus"])
+        frontends.append(frontend)
+
+    print(f" API sur http://{settings['host']}:{settings['port']} "
+          f"({len(frontends)} front-ends, {settings['inference_processes']} processus d'inférence)")
+
+    try:
+        for frontend in frontends:
+            frontend.join()
+    except KeyboardInterrupt:
+        print(" Arrêt de l'API...")
+    finally:
+        for frontend in frontends:
+            frontend.terminate()
+        pool.stop()
+        listen_socket.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+"""
+Script de test des processus d'inférence (inference_worker.py)
+Vérifie le passage des lots par mémoire partagée, les échéances et la reprise
+après la mort d'un processus, avec un unet_model factice (sans TensorFlow)
+"""
+
+import multiprocessing as mp
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+from inference_worker import InferenceClient, WorkerPool, run_inference_worker, start_pinned
+from response_codec import file_identity
+
+# Remplace unet_model dans les processus d'inférence: renvoie le lot tel quel,
+# et simule une longue prédiction si la première valeur du lot est négative
+STUB_UNET_MODEL = '''
+import time
+
+def configure_threads(intra_op_threads=0, inter_op_threads=0):
+    pass
+
+class StubModel:
+    def predict(self, batch, verbose=0):
+        if batch.flat[0] < 0:
+            time.sleep(-float(batch.flat[0]))
+        return batch
+
+def load_unet_model(model_path):
+    return StubModel()
+'''
+
+KILL_SIGNAL = getattr(signal, "SIGKILL", signal.SIGTERM)
+
+_settings = None
+
+
+def make_settings():
+    """Crée le unet_model factice (une seule fois) et les réglages des processus"""
+    global _settings
+    if _settings is None:
+        stub_dir = tempfile.mkdtemp()
+        with open(os.path.join(stub_dir, "unet_model.py"), "w") as f:
+            f.write(STUB_UNET_MODEL)
+        model_path = os.path.join(stub_dir, "model.h5")
+        with open(model_path, "wb") as f:
+            f.write(b"stub")
+        # Hérité par les processus lancés en spawn
+        sys.path.insert(0, stub_dir)
+        _settings = {
+            "inference_cpus": [set()],
+            "intra_op_threads": 0,
+            "inter_op_threads": 0,
+            "model_path": model_path,
+            "model_id": file_identity(model_path),
+            "threshold": 0.5,
+        }
+    return _settings
+
+def wait_until(condition, timeout=20):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Condition non atteinte à temps"
+        time.sleep(0.05)
+
+def start_pool(worker_count):
+    ctx = mp.get_context("spawn")
+    request_queues = [ctx.Queue()]
+    response_queues = [ctx.Queue()]
+    ready_event = ctx.Event()
+    pool = WorkerPool(ctx, worker_count, request_queues, response_queues, ready_event,
+                      make_settings(), watch_interval=0.1)
+    pool.start()
+    client = InferenceClient(0, request_queues[0], response_queues[0], ready_event, timeout=30)
+    wait_until(lambda: pool.loaded_workers() == worker_count)
+    return pool, client
+
+def random_batch(size=4):
+    return np.random.rand(size, 256, 256, 1).astype(np.float32)
+
+def test_mask_round_trip():
+    """Les masques d'un lot (N, 256, 256, 1) reviennent intacts par mémoire partagée"""
+    print("🧪 Test 1: Aller-retour des masques")
+    pool, client = start_pool(1)
+    try:
+        batch = random_batch(8)
+        masks = client.predict(batch)
+        assert masks.dtype == np.uint8 and masks.shape == batch.shape
+        assert np.array_equal(masks, (batch > 0.5).astype(np.uint8))
+    finally:
+        pool.stop()
+    print(f"✅ {len(batch)} masques identiques")
+
+def test_expired_job():
+    """Un lot dont l'échéance est passée reçoit une erreur sans être prédit"""
+    print("\n🧪 Test 2: Lot expiré")
+    ctx = mp.get_context("spawn")
+    connection, child_connection = ctx.Pipe()
+    process = ctx.Process(target=run_inference_worker, args=(0, child_connection, make_settings()))
+    process.start()
+    child_connection.close()
+
+    batch = random_batch(2)
+    shm = shared_memory.SharedMemory(create=True, size=batch.nbytes + batch.size)
+    try:
+        np.ndarray(batch.shape, dtype=np.float32, buffer=shm.buf)[:] = batch
+        np.ndarray(batch.shape, dtype=np.uint8, buffer=shm.buf, offset=batch.nbytes)[:] = 7
+
+        assert connection.poll(20) and connection.recv() == ("loaded",)
+        connection.send((1, 0, shm.name, batch.shape, time.time() - 1))
+        assert connection.poll(20)
+        assert connection.recv() == ("done", 0, 1, "Délai dépassé")
+
+        untouched = np.ndarray(batch.shape, dtype=np.uint8, buffer=shm.buf, offset=batch.nbytes)
+        assert (untouched == 7).all()
+        del untouched
+    finally:
+        connection.send(None)
+        process.join(timeout=10)
+        shm.close()
+        shm.unlink()
+    print("✅ Erreur renvoyée, masques non écrits")
+
+def test_kill_between_jobs():
+    """Un processus tué au repos ne bloque ni les autres ni son remplaçant"""
+    print("\n🧪 Test 3: Processus tué entre deux lots")
+    pool, client = start_pool(2)
+    try:
+        killed_pid = pool.worker_pids()[0]
+        os.kill(killed_pid, KILL_SIGNAL)
+        wait_until(lambda: pool.loaded_workers() == 1)
+
+        # Le survivant sert tous les lots
+        for _ in range(4):
+            batch = random_batch(2)
+            assert np.array_equal(client.predict(batch), (batch > 0.5).astype(np.uint8))
+
+        # Le remplaçant reprend du service
+        wait_until(lambda: pool.loaded_workers() == 2)
+        assert pool.worker_pids()[0] != killed_pid
+        os.kill(pool.worker_pids()[1], KILL_SIGNAL)
+        wait_until(lambda: pool.loaded_workers() == 1)
+        batch = random_batch(2)
+        assert np.array_equal(client.predict(batch), (batch > 0.5).astype(np.uint8))
+    finally:
+        pool.stop()
+    print("✅ Lots servis par le survivant puis par le remplaçant")
+
+def test_kill_during_job():
+    """Un processus tué pendant un lot fait échouer l'appelant sans attendre le délai"""
+    print("\n🧪 Test 4: Processus tué pendant un lot")
+    pool, client = start_pool(1)
+    try:
+        batch = random_batch(2)
+        batch.flat[0] = -30  # prédiction simulée de 30 s
+        outcome = {}
+
+        def call():
+            try:
+                client.predict(batch)
+                outcome["error"] = None
+            except Exception as e:
+                outcome["error"] = e
+
+        caller = threading.Thread(target=call)
+        caller.start()
+        time.sleep(1.0)
+        started = time.monotonic()
+        os.kill(pool.worker_pids()[0], KILL_SIGNAL)
+        caller.join(timeout=10)
+
+        assert not caller.is_alive(), "L'appelant est resté bloqué"
+        assert isinstance(outcome["error"], RuntimeError)
+        print(f"   Échec remonté en {time.monotonic() - started:.1f} s: {outcome['error']}")
+
+        wait_until(lambda: pool.loaded_workers() == 1)
+        batch = random_batch(2)
+        assert np.array_equal(client.predict(batch), (batch > 0.5).astype(np.uint8))
+    finally:
+        pool.stop()
+    print("✅ Appelant débloqué, processus relancé")
+
+def test_start_pinned():
+    """Le processus lancé hérite de l'affinité demandée, le parent garde la sienne"""
+    print("\n🧪 Test 5: Épinglage CPU")
+    if not hasattr(os, "sched_getaffinity"):
+        pytest.skip("sched_getaffinity indisponible (épinglage via psutil)")
+
+    previous = os.sched_getaffinity(0)
+    cpus = {min(previous)}
+    process = mp.get_context("spawn").Process(target=time.sleep, args=(10,))
+    start_pinned(process, cpus)
+    try:
+        assert os.sched_getaffinity(process.pid) == cpus
+        assert os.sched_getaffinity(0) == previous
+    finally:
+        process.terminate()
+        process.join()
+    print(f"✅ Enfant épinglé sur {sorted(cpus)}, parent restauré")
+
+TESTS = [
+    ("Aller-retour des masques", test_mask_round_trip),
+    ("Lot expiré", test_expired_job),
+    ("Processus tué entre deux lots", test_kill_between_jobs),
+    ("Processus tué pendant un lot", test_kill_during_job),
+    ("Épinglage CPU", test_start_pinned),
+]
+
+def run_all_tests():
+    """Exécute tous les tests"""
+    print("=" * 60)
+    print("🚀 TEST DES PROCESSUS D'INFÉRENCE")
+    print("=" * 60)
+
+    results = []
+    for test_name, test in TESTS:
+        try:
+            test()
+            results.append((test_name, "PASS"))
+        except pytest.skip.Exception as e:
+            print(f"   Ignoré: {e}")
+            results.append((test_name, "SKIP"))
+        except AssertionError as e:
+            print(f"❌ {e}")
+            results.append((test_name, "FAIL"))
+
+    # Résumé
+    print("\n" + "=" * 60)
+    print("📊 RÉSUMÉ DES TESTS")
+    print("=" * 60)
+
+    icons = {"PASS": "✅", "SKIP": "⏭️ ", "FAIL": "❌"}
+    for test_name, status in results:
+        print(f"{icons[status]} {status} - {test_name}")
+
+    passed = sum(1 for _, status in results if status == "PASS")
+    skipped = sum(1 for _, status in results if status == "SKIP")
+    failed = sum(1 for _, status in results if status == "FAIL")
+
+    print(f"\nRésultat: {passed}/{len(results)} tests passés, {skipped} ignoré(s)")
+
+    if failed == 0:
+        print("🎉 Tous les tests exécutés sont réussis!")
+    else:
+        print("⚠️  Certains tests ont échoué. Vérifiez les logs ci-dessus.")
+
+if __name__ == "__main__":
+    run_all_tests()
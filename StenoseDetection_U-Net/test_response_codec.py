@@ -0,0 +1,175 @@
+"""
+Script de test de la sérialisation des réponses (response_codec.py)
+Vérifie formats, compression et ETags sans serveur ni TensorFlow:
+l'application Flask est appelée via son client de test avec un modèle factice
+"""
+
+import base64
+import gzip
+import json
+from glob import glob
+
+import numpy as np
+import pytest
+
+import flask_api
+import response_codec
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+BINARY_PAYLOAD = {"success": True, "areas_left": [12.5, 0.0], "masks": [PNG_SIGNATURE + b"data"]}
+
+# Même empreinte de modèle en script et sous pytest, donc mêmes ETags
+flask_api.MODEL_ID = "test"
+
+
+class FakeModel:
+    """Remplace le U-Net: masques vides, compte les appels"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, batch, verbose=0):
+        self.calls += 1
+        return np.zeros(batch.shape, dtype=np.float32)
+
+
+def load_test_image_b64():
+    image_paths = sorted(glob("input/*.png"))
+    with open(image_paths[0], "rb") as f:
+        return base64.b64encode(f.read()).decode("utf-8")
+
+def test_json_body():
+    """Corps JSON par défaut: mêmes champs que l'ancien jsonify, masques en base64"""
+    print("🧪 Test 1: Corps JSON par défaut")
+    flask_api.model = FakeModel()
+    client = flask_api.app.test_client()
+
+    response = client.post("/api/detect-stenosis", json={"images": [load_test_image_b64()] * 2})
+    assert response.status_code == 200, response.status_code
+    assert response.mimetype == response_codec.JSON, response.mimetype
+
+    result = json.loads(response.data)
+    expected_fields = {"success", "stenosis_left_percent", "stenosis_right_percent",
+                       "processed_images", "areas_left", "areas_right", "masks"}
+    assert set(result) == expected_fields, sorted(result)
+
+    masks = [base64.b64decode(mask) for mask in result["masks"]]
+    assert len(masks) == 2
+    assert all(mask.startswith(PNG_SIGNATURE) for mask in masks), "Masques non PNG"
+    print(f"✅ Champs identiques, {len(masks)} masques PNG en base64")
+
+def test_msgpack_body():
+    """MessagePack: masques transmis en octets bruts"""
+    print("\n🧪 Test 2: MessagePack")
+    msgpack = pytest.importorskip("msgpack")
+    decoded = msgpack.unpackb(response_codec.encode_body(BINARY_PAYLOAD, response_codec.MSGPACK))
+    assert decoded == BINARY_PAYLOAD
+    print("✅ Masque transmis en octets bruts")
+
+def test_cbor_body():
+    """CBOR: masques transmis en octets bruts"""
+    print("\n🧪 Test 3: CBOR")
+    cbor2 = pytest.importorskip("cbor2")
+    decoded = cbor2.loads(response_codec.encode_body(BINARY_PAYLOAD, response_codec.CBOR))
+    assert decoded == BINARY_PAYLOAD
+    print("✅ Masque transmis en octets bruts")
+
+def test_compression():
+    """gzip appliqué uniquement au-delà de MIN_COMPRESS_SIZE"""
+    print("\n🧪 Test 4: Compression")
+    small = b"x" * (response_codec.MIN_COMPRESS_SIZE - 1)
+    large = b"x" * (response_codec.MIN_COMPRESS_SIZE * 4)
+
+    body, encoding = response_codec.compress_body(small, "gzip")
+    assert encoding == response_codec.IDENTITY and body == small, "Petit corps compressé"
+
+    body, encoding = response_codec.compress_body(large, "gzip")
+    assert encoding == "gzip" and gzip.decompress(body) == large, "Grand corps non compressé"
+    print(f"✅ {len(small)} octets laissés tels quels, {len(large)} -> {len(body)} octets en gzip")
+
+def test_negotiation_and_etag():
+    """Négociation Accept / Accept-Encoding et stabilité des ETags"""
+    print("\n🧪 Test 5: Négociation et ETags")
+    app = flask_api.app
+
+    with app.test_request_context("/", headers={"Accept": "*/*", "Accept-Encoding": "gzip, deflate"}):
+        assert flask_api.negotiate_representation() == (response_codec.JSON, "gzip")
+    with app.test_request_context("/"):
+        assert flask_api.negotiate_representation() == (response_codec.JSON, response_codec.IDENTITY)
+
+    assert response_codec.make_etag("a", b"b") == response_codec.make_etag("a", b"b"), "ETag non déterministe"
+    assert response_codec.make_etag("ab", "c") != response_codec.make_etag("a", "bc"), "ETag ambigu"
+    print("✅ Négociation et ETags corrects")
+
+def test_not_modified():
+    """Une requête répétée avec If-None-Match renvoie 304 sans appeler le modèle"""
+    print("\n🧪 Test 6: Revalidation 304")
+    fake_model = FakeModel()
+    flask_api.model = fake_model
+    client = flask_api.app.test_client()
+    payload = {"image": load_test_image_b64()}
+
+    first = client.post("/api/process-single", json=payload)
+    etag = first.headers.get("ETag")
+    assert first.status_code == 200 and etag, (first.status_code, etag)
+
+    repeat = client.post("/api/process-single", json=payload, headers={"If-None-Match": etag})
+    weak = client.post("/api/process-single", json=payload, headers={"If-None-Match": "W/" + etag})
+    assert repeat.status_code == 304, repeat.status_code
+    assert weak.status_code == 304, weak.status_code
+    assert fake_model.calls == 1, fake_model.calls
+
+    star = client.post("/api/process-single", json=payload, headers={"If-None-Match": "*"})
+    assert star.status_code == 200, star.status_code
+    print(f"✅ 304 sur ETag fort et faible, modèle appelé {fake_model.calls} fois")
+
+TESTS = [
+    ("Corps JSON", test_json_body),
+    ("MessagePack", test_msgpack_body),
+    ("CBOR", test_cbor_body),
+    ("Compression", test_compression),
+    ("Négociation et ETags", test_negotiation_and_etag),
+    ("Revalidation 304", test_not_modified),
+]
+
+def run_all_tests():
+    """Exécute tous les tests"""
+    print("=" * 60)
+    print("🚀 TEST DE LA SÉRIALISATION DES RÉPONSES")
+    print("=" * 60)
+
+    results = []
+    for test_name, test in TESTS:
+        try:
+            test()
+            results.append((test_name, "PASS"))
+        except pytest.skip.Exception as e:
+            print(f"   Ignoré: {e}")
+            results.append((test_name, "SKIP"))
+        except AssertionError as e:
+            print(f"❌ {e}")
+            results.append((test_name, "FAIL"))
+
+    # Résumé
+    print("\n" + "=" * 60)
+    print("📊 RÉSUMÉ DES TESTS")
+    print("=" * 60)
+
+    icons = {"PASS": "✅", "SKIP": "⏭️ ", "FAIL": "❌"}
+    for test_name, status in results:
+        print(f"{icons[status]} {status} - {test_name}")
+
+    passed = sum(1 for _, status in results if status == "PASS")
+    skipped = sum(1 for _, status in results if status == "SKIP")
+    failed = sum(1 for _, status in results if status == "FAIL")
+
+    print(f"\nRésultat: {passed}/{len(results)} tests passés, {skipped} ignoré(s)")
+
+    if failed == 0:
+        print("🎉 Tous les tests exécutés sont réussis!")
+    else:
+        print("⚠️  Certains tests ont échoué. Vérifiez les logs ci-dessus.")
+
+if __name__ == "__main__":
+    run_all_tests()
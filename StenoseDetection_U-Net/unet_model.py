@@ -0,0 +1,55 @@
+"""
+Chargement du modèle U-Net de détection de sténose
+Isolé de flask_api.py pour que les processus front-end n'importent pas TensorFlow
+"""
+
+import tensorflow as tf
+from tensorflow.keras.models import load_model
+from tensorflow.keras.optimizers import Adam
+import configparser
+
+# Configuration
+config = configparser.ConfigParser()
+config.read("config.ini")
+CLASS_WEIGHT = float(config["model"]["class_weight"])
+
+# Fonctions personnalisées pour le modèle
+def weighted_binary_crossentropy(y_true, y_pred):
+    pos_weight = CLASS_WEIGHT
+    epsilon = tf.keras.backend.epsilon()
+    y_pred = tf.clip_by_value(y_pred, epsilon, 1.0 - epsilon)
+    bce = -(y_true * tf.math.log(y_pred) + (1.0 - y_true) * tf.math.log(1.0 - y_pred))
+    weighted_bce = bce * (y_true * pos_weight + (1.0 - y_true))
+    return tf.reduce_mean(weighted_bce)
+
+def dice_coefficient(y_true, y_pred, smooth=1.0):
+    y_true_f = tf.cast(tf.keras.backend.flatten(y_true), tf.float32)
+    y_pred_f = tf.keras.backend.flatten(y_pred)
+    intersection = tf.keras.backend.sum(y_true_f * y_pred_f)
+    return (2. * intersection + smooth) / (tf.keras.backend.sum(y_true_f) + tf.keras.backend.sum(y_pred_f) + smooth)
+
+def configure_threads(intra_op_threads=0, inter_op_threads=0):
+    """Règle les pools de threads TensorFlow (0 = valeur par défaut de TF)
+
+    Doit être appelé avant le chargement du modèle, TensorFlow refusant
+    de changer ces valeurs une fois le runtime initialisé.
+    """
+    if intra_op_threads > 0:
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    if inter_op_threads > 0:
+        tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+
+def load_unet_model(model_path="carotide_detector_v2.h5"):
+    """Charge le modèle U-Net au démarrage de l'API"""
+    try:
+        model = load_model(model_path, compile=False)
+        model.compile(
+            optimizer=Adam(learning_rate=0.0001),
+            loss=weighted_binary_crossentropy,
+            metrics=['accuracy', dice_coefficient]
+        )
+        print(f" Modèle {model_path} chargé avec succès")
+        return model
+    except Exception as e:
+        print(f" Erreur lors du chargement du modèle: {e}")
+        return None